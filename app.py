@@ -1,23 +1,192 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
+from flask.json.provider import JSONProvider
 from flask_cors import CORS
 from datetime import datetime, timedelta
-from pymongo import MongoClient
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from functools import partial
+from typing import Callable
+from bson import ObjectId
+from pymongo import MongoClient, ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from twilio.rest import Client as TwilioClient
+from twilio.http.http_client import TwilioHttpClient
+import atexit
+import cachetools.func
 import joblib
 import os
+import queue
+import threading
+import time
 import numpy as np
+import onnxruntime as ort
+import orjson
+from numba import njit
+
+
+def _json_default(o):
+    if isinstance(o, ObjectId):
+        return str(o)
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+class ORJSONProvider(JSONProvider):
+    """
+    Flask JSON provider backed by orjson. Datetimes (BSON dates) come out
+    as ISO-8601, matching the strings stored before they were native.
+    """
+
+    def dumps(self, obj, **kwargs) -> str:
+        return orjson.dumps(obj, default=_json_default).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs) -> Response:
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, default=_json_default), mimetype="application/json"
+        )
+
+
+def orjson_response(obj) -> Response:
+    """Serialise straight to a JSON Response, skipping jsonify."""
+    return Response(orjson.dumps(obj, default=_json_default), mimetype="application/json")
+
 
 app = Flask(__name__)
+app.json = ORJSONProvider(app)
 CORS(app)
 
 # ===============================
 # MongoDB
 # ===============================
-mongo_client       = MongoClient("mongodb://localhost:27017/")
+MONGO_URI          = "mongodb://localhost:27017/"
+mongo_client       = MongoClient(MONGO_URI, maxPoolSize=50)
 db                 = mongo_client["mhews"]
 collection         = db["sensor_data"]
 alerts_collection  = db["alerts"]
 sms_log_collection = db["sms_log"]      # tracks sent SMS to avoid spam
+counters_collection = db["counters"]    # atomic sequence numbers (alert IDs)
+
+# (collection, keys, options) for the indexes backing the hot queries
+INDEXES = [
+    (sms_log_collection, [("alert_type", 1), ("sent_at", -1)], {}),               # cooldown lookup
+    (collection,         [("timestamp", 1)], {}),                                 # weekly risk range
+    (alerts_collection,  [("id", 1)], {"unique": True}),                          # resolve / delete
+    (alerts_collection,  [("active_rank", 1), ("severity_rank", 1), ("_id", -1)], {}),  # alerts listing
+]
+
+
+def _ensure_indexes():
+    """
+    Create the indexes (idempotent; run by _run_startup_tasks). Each index
+    is built on its own, so one failure (e.g. legacy duplicate alert ids
+    blocking the unique index) doesn't skip the rest.
+    """
+    for coll, keys, options in INDEXES:
+        name = "_".join(f"{field}_{direction}" for field, direction in keys)
+        try:
+            coll.create_index(keys, **options)
+        except Exception as e:
+            print(f"Index Creation Error ({coll.name}.{name}):", e)
+
+
+# ===============================
+# Sensor Write-Behind Buffer
+# ===============================
+SENSOR_FLUSH_MAX_ROWS = 200   # flush as soon as this many readings are queued
+SENSOR_FLUSH_INTERVAL = 0.5   # seconds; flush at least this often otherwise
+SENSOR_BUFFER_CAP     = 20000 # rows kept for retry while Mongo is down
+
+
+class _WriteBehindBuffer:
+    """
+    Buffers documents in memory and writes them with insert_many from a
+    background thread, keeping Mongo off the request path.
+
+    Durability trade-off: readings are acknowledged before they are
+    persisted, so pending rows are lost if the process is killed hard.
+    A batch that fails on a transient error (e.g. Mongo unreachable) is
+    put back at the front and retried; only once more than `cap` rows
+    are pending are the oldest dropped (logged). Pending rows are
+    flushed on normal interpreter exit.
+    """
+
+    def __init__(self, target, max_rows: int, interval: float, cap: int):
+        self._target   = target
+        self._max_rows = max_rows
+        self._interval = interval
+        self._cap      = cap
+        self._rows     = deque()
+        self._lock     = threading.Lock()
+        self._wake     = threading.Event()
+        self._thread   = None
+        atexit.register(self.flush)
+
+    def append(self, doc: dict):
+        if self._thread is None:
+            self._start()
+        with self._lock:
+            self._rows.append(doc)
+            full = len(self._rows) >= self._max_rows
+        if full:
+            self._wake.set()
+
+    def flush(self) -> bool:
+        """Write pending rows; returns False if they were requeued."""
+        with self._lock:
+            if not self._rows:
+                return True
+            batch = list(self._rows)
+            self._rows.clear()
+        try:
+            self._target.insert_many(batch, ordered=False)
+        except BulkWriteError as e:
+            # The server processed the batch: duplicate keys are rows a
+            # retried batch already stored, anything else won't succeed
+            # on retry either.
+            rejected = [err for err in e.details.get("writeErrors", []) if err.get("code") != 11000]
+            if rejected:
+                print(f"Write-Behind Flush: {len(rejected)} rows rejected and dropped:",
+                      rejected[0].get("errmsg"))
+        except Exception as e:
+            self._requeue(batch)
+            print(f"Write-Behind Flush Error ({len(batch)} rows requeued): {e!r}")
+            return False
+        return True
+
+    def _requeue(self, batch: list):
+        with self._lock:
+            self._rows.extendleft(reversed(batch))
+            overflow = len(self._rows) - self._cap
+            for _ in range(max(overflow, 0)):
+                self._rows.popleft()
+        if overflow > 0:
+            print(f"Write-Behind Buffer full: dropped {overflow} oldest rows")
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="sensor-writer", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self._interval)
+            self._wake.clear()
+            if not self.flush():
+                time.sleep(self._interval)   # back off while Mongo is failing
+
+
+sensor_writer = _WriteBehindBuffer(
+    collection, SENSOR_FLUSH_MAX_ROWS, SENSOR_FLUSH_INTERVAL, SENSOR_BUFFER_CAP
+)
 
 # ===============================
 # Twilio Configuration
@@ -32,7 +201,31 @@ ALERT_RECIPIENTS = [
     # os.environ.get("ALERT_PHONE_2", "+91XXXXXXXXXX"),  # add more as needed
 ]
 
-twilio_client = TwilioClient(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
+# Max parallel Twilio API calls per SMS broadcast
+SMS_MAX_WORKERS = 16
+# Background threads for sensor-triggered SMS (kept off the request path)
+SMS_DISPATCH_WORKERS = 8
+# Seconds per Twilio HTTP request (connect and read); without it a hung
+# socket would block a dispatch thread indefinitely
+TWILIO_TIMEOUT = 10
+
+
+def _build_twilio_http_client() -> TwilioHttpClient:
+    """Twilio HTTP client backed by a pooled keep-alive session, so repeated
+    sends reuse TLS connections instead of handshaking per message."""
+    http_client = TwilioHttpClient(pool_connections=True, timeout=TWILIO_TIMEOUT)
+    http_client.session.mount("https://", HTTPAdapter(
+        pool_connections=8,
+        pool_maxsize=32,
+        max_retries=Retry(total=2, backoff_factor=0.2),
+    ))
+    return http_client
+
+
+twilio_client = TwilioClient(
+    TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN,
+    http_client=_build_twilio_http_client()
+)
 
 # ===============================
 # SMS Cooldown Config
@@ -58,117 +251,421 @@ THRESHOLDS = {
     "soil_moisture":{"warn": 80,  "critical": 95},   # percent
 }
 
+# Hoisted for the per-reading checks in check_and_send_sensor_sms
+_D_CRIT = THRESHOLDS["distance"]["critical"]
+_D_WARN = THRESHOLDS["distance"]["warn"]
+_R_CRIT = THRESHOLDS["rain_level"]["critical"]
+_R_WARN = THRESHOLDS["rain_level"]["warn"]
+_A_CRIT = THRESHOLDS["air_quality"]["critical"]
+_A_WARN = THRESHOLDS["air_quality"]["warn"]
+_T_CRIT = THRESHOLDS["temperature"]["critical"]
+_T_WARN = THRESHOLDS["temperature"]["warn"]
+
+
+# ===============================
+# Sensor SMS Templates
+# ===============================
+# Filled with str.format_map; {ts} is the reading's datetime.
+_SMS_TIME = "Time: {ts:%Y-%m-%d %H:%M:%S} UTC"
+
+SMS_FLOOD_CRITICAL = (
+    "MHEWS CRITICAL FLOOD ALERT\n"
+    "Water sensor: {distance}cm (DANGER LEVEL)\n"
+    "Immediate evacuation may be required.\n" + _SMS_TIME
+)
+SMS_FLOOD_WARN = (
+    "MHEWS Flood Warning\n"
+    "Water rising. Distance: {distance}cm.\n"
+    "Monitor closely and prepare to evacuate.\n" + _SMS_TIME
+)
+SMS_RAIN_CRITICAL = (
+    "MHEWS Heavy Rain CRITICAL\n"
+    "Rain sensor: {rain}/100\n"
+    "Flash flood risk. Move to higher ground.\n" + _SMS_TIME
+)
+SMS_RAIN_WARN = (
+    "MHEWS Rain Advisory\n"
+    "Rain intensity: {rain}/100 (HIGH)\n"
+    "Avoid low-lying areas.\n" + _SMS_TIME
+)
+SMS_AIR_CRITICAL = (
+    "MHEWS Air Quality CRITICAL\n"
+    "AQI: {air} PPM — Hazardous.\n"
+    "Stay indoors. Wear masks immediately.\n" + _SMS_TIME
+)
+SMS_AIR_WARN = (
+    "MHEWS Air Quality Warning\n"
+    "AQI: {air} PPM — Unhealthy.\n"
+    "Limit outdoor exposure.\n" + _SMS_TIME
+)
+SMS_FIRE_CRITICAL = (
+    "MHEWS Extreme Heat / Fire Risk\n"
+    "Temperature: {temperature}C (CRITICAL)\n"
+    "Extreme fire danger conditions.\n" + _SMS_TIME
+)
+SMS_FIRE_WARN = (
+    "MHEWS Heat Warning\n"
+    "Temperature: {temperature}C (HIGH)\n"
+    "High fire risk. Stay alert.\n" + _SMS_TIME
+)
+SMS_RISK_HIGH = (
+    "MHEWS SYSTEM ALERT — HIGH RISK\n"
+    "ML model predicts HIGH hazard risk.\n"
+    "Temp:{temperature}C Rain:{rain} Water:{distance}cm AQI:{air}\n" + _SMS_TIME
+)
+
 
 # ===============================
 # Load ML Model
 # ===============================
-model = joblib.load("rf_multi_hazard_model.pkl")
-EXPECTED_FEATURES = model.n_features_in_
+MODEL_PATH      = "rf_multi_hazard_model.pkl"
+ONNX_MODEL_PATH = "rf_multi_hazard_model.onnx"   # generated by convert_model.py
+
+
+def _load_model():
+    """
+    Returns (predict_fn, n_features). Uses the ONNX export through ONNX
+    Runtime when present and at least as new as the pickle, otherwise the
+    pickled scikit-learn forest.
+    predict_fn takes a (B, n_features) array and returns B class labels.
+    """
+    use_onnx = os.path.exists(ONNX_MODEL_PATH)
+    if use_onnx and os.path.getmtime(ONNX_MODEL_PATH) < os.path.getmtime(MODEL_PATH):
+        print(f"WARNING: {ONNX_MODEL_PATH} is older than {MODEL_PATH}; "
+              f"ignoring it — re-run convert_model.py after retraining.")
+        use_onnx = False
+
+    if use_onnx:
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads     = 1   # concurrency comes from gunicorn workers
+        session = ort.InferenceSession(
+            ONNX_MODEL_PATH, options, providers=["CPUExecutionProvider"]
+        )
+        model_input = session.get_inputs()[0]
+        label_name  = session.get_outputs()[0].name
+
+        def predict(batch):
+            feed = {model_input.name: batch.astype(np.float32, copy=False)}
+            return session.run([label_name], feed)[0]
+
+        print("Model backend: ONNX Runtime")
+        return predict, model_input.shape[1]
+
+    model = joblib.load(MODEL_PATH)
+    print("Model backend: scikit-learn")
+    return model.predict, model.n_features_in_
+
+
+predict_model, EXPECTED_FEATURES = _load_model()
 print("Model expects features:", EXPECTED_FEATURES)
 
 
 # ===============================
 # Feature Engineering
 # ===============================
+@njit(cache=True)
+def fill_features(out, temperature, humidity, soil, rain, air, distance):
+    """Write the 10 engineered features into out[:10]; the rest is left as-is."""
+    moisture_index = soil * 0.6 + rain * 0.4
+    out[0] = temperature
+    out[1] = humidity
+    out[2] = soil
+    out[3] = rain
+    out[4] = air
+    out[5] = distance
+    out[6] = (soil + rain) / 2                # water_level
+    out[7] = moisture_index
+    out[8] = 100 - moisture_index             # dryness_index
+    out[9] = temperature + humidity * 0.1     # heat_index
+
+
+# Compile at import so the first sensor POST doesn't pay the JIT cost
+fill_features(np.zeros(EXPECTED_FEATURES, dtype=np.float32), 0.0, 0.0, 0.0, 0.0, 0.0, 0.0)
+
+
+_tls = threading.local()
+
+
+def _feature_buffer():
+    """This thread's (1, EXPECTED_FEATURES) float32 buffer; padding is zeroed once here."""
+    buf = getattr(_tls, "features", None)
+    if buf is None:
+        buf = _tls.features = np.zeros((1, EXPECTED_FEATURES), dtype=np.float32)
+    return buf
+
+
+def _discard_feature_buffer():
+    _tls.features = None
+
+
 def build_feature_vector(sensor_data):
-    temperature = sensor_data.get("temperature", 0)
-    humidity    = sensor_data.get("humidity", 0)
-    soil        = sensor_data.get("soil_moisture", 0)
-    rain        = sensor_data.get("rain_level", 0)
-    air         = sensor_data.get("air_quality", 0)
-    distance    = sensor_data.get("distance", 0)
-
-    water_level    = (soil + rain) / 2
-    moisture_index = (soil * 0.6 + rain * 0.4)
-    dryness_index  = 100 - moisture_index
-    heat_index     = temperature + (humidity * 0.1)
-
-    features = [
-        temperature, humidity, soil, rain, air, distance,
-        water_level, moisture_index, dryness_index, heat_index
-    ]
-    while len(features) < EXPECTED_FEATURES:
-        features.append(0)
+    """
+    Fill and return the calling thread's (1, N) feature buffer in place.
+    The array is reused, so it is only valid until the thread's next call.
+    """
+    features = _feature_buffer()
+    fill_features(
+        features[0],
+        float(sensor_data.get("temperature", 0)),
+        float(sensor_data.get("humidity", 0)),
+        float(sensor_data.get("soil_moisture", 0)),
+        float(sensor_data.get("rain_level", 0)),
+        float(sensor_data.get("air_quality", 0)),
+        float(sensor_data.get("distance", 0)),
+    )
     return features
 
 
 # ===============================
 # Risk Evaluation
 # ===============================
+PREDICT_BATCH_MAX      = 64     # rows per predict_model call
+PREDICT_BATCH_WAIT     = 0.01   # seconds to wait for more rows after the first
+PREDICT_RESULT_TIMEOUT = 0.2   # seconds a request waits for its prediction
+
+
+class _PredictQueue:
+    """
+    Coalesces concurrent single-row predictions into one batched
+    predict_model call. The consumer thread is started on first use so
+    it is created inside each worker process, not before a fork.
+    """
+
+    def __init__(self, predict_fn, max_batch: int, max_wait: float):
+        self._predict_fn = predict_fn
+        self._max_batch  = max_batch
+        self._max_wait   = max_wait
+        self._queue      = queue.Queue()
+        self._thread     = None
+        self._lock       = threading.Lock()
+
+    def submit(self, features) -> Future:
+        if self._thread is None:
+            self._start()
+        future = Future()
+        self._queue.put((features, future))
+        return future
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="predict-batcher", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            items    = [self._queue.get()]
+            deadline = time.monotonic() + self._max_wait
+            while len(items) < self._max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    items.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            try:
+                predictions = self._predict_fn(np.vstack([f for f, _ in items]))
+            except Exception as e:
+                for _, future in items:
+                    future.set_exception(e)
+                continue
+            for (_, future), prediction in zip(items, predictions):
+                future.set_result(prediction)
+
+
+_predict_queue = _PredictQueue(predict_model, PREDICT_BATCH_MAX, PREDICT_BATCH_WAIT)
+
+
+PREDICTION_LABELS = {0: "LOW", 1: "MEDIUM", 2: "HIGH"}
+RISK_SCORE_MAP    = {"LOW": 1, "MEDIUM": 2, "HIGH": 3, "UNKNOWN": 0}
+RISK_LABEL_MAP    = {1: "LOW", 2: "MEDIUM", 3: "HIGH", 0: "UNKNOWN"}
+
+
 def evaluate_risk(sensor_data):
     try:
-        features_array = np.array([build_feature_vector(sensor_data)])
-        prediction     = model.predict(features_array)[0]
-        return {0: "LOW", 1: "MEDIUM", 2: "HIGH"}.get(prediction, "UNKNOWN")
+        future = _predict_queue.submit(build_feature_vector(sensor_data))
+        try:
+            prediction = future.result(timeout=PREDICT_RESULT_TIMEOUT)
+        finally:
+            if not future.done():
+                # Still queued: the batcher will read this buffer later, so
+                # the next request on this thread must not overwrite it.
+                _discard_feature_buffer()
+        return PREDICTION_LABELS.get(prediction, "UNKNOWN")
+    except FutureTimeoutError:
+        print(f"Prediction Timeout: no result within {PREDICT_RESULT_TIMEOUT}s, risk UNKNOWN")
+        return "UNKNOWN"
     except Exception as e:
-        print("Prediction Error:", e)
+        print(f"Prediction Error: {e!r}")
         return "UNKNOWN"
 
 
 # ===============================
 # SMS Core Helpers
 # ===============================
+# Monotonic time of the last send per alert_type known to this process.
+# Only trusted when it says "on cooldown": other gunicorn workers send too,
+# so a local miss is confirmed against sms_log, which is shared. The miss
+# happens about once per window, right before a Twilio call.
+_last_sent: dict[str, float] = {}
+# alert_type -> monotonic claim time of a send in progress in this process
+_in_flight: dict[str, float] = {}
+_cooldown_lock = threading.Lock()
+# A reservation older than this is treated as stuck and taken over, so a
+# hung send can't silence an alert type for good. Comfortably above the
+# worst case of the sms_log lookup plus retried TWILIO_TIMEOUT requests.
+SMS_IN_FLIGHT_MAX_AGE = 120
+
+
 def _is_on_cooldown(alert_type: str) -> bool:
     """True if same alert_type was sent within the cooldown window."""
     cooldown_mins = SMS_COOLDOWN_MINUTES.get(alert_type, 30)
     if cooldown_mins == 0:
         return False
-    cutoff = (datetime.utcnow() - timedelta(minutes=cooldown_mins)).isoformat()
-    return sms_log_collection.find_one({
-        "alert_type": alert_type,
-        "sent_at":    {"$gte": cutoff}
-    }) is not None
+    last = _last_sent.get(alert_type)
+    if last is not None and time.monotonic() - last < cooldown_mins * 60:
+        return True
+
+    cutoff = datetime.utcnow() - timedelta(minutes=cooldown_mins)
+    doc    = sms_log_collection.find_one(
+        {"alert_type": alert_type, "sent_at": {"$gte": cutoff}},
+        sort=[("sent_at", -1)]
+    )
+    if doc is None:
+        return False
+    # Sent elsewhere (or before a restart); cache it for the rest of the window
+    age = (datetime.utcnow() - doc["sent_at"]).total_seconds()
+    _last_sent[alert_type] = time.monotonic() - age
+    return True
+
+
+def _claim_cooldown(alert_type: str):
+    """
+    Reserve the right to send alert_type now, so a concurrent send of the
+    same type in this process is dropped. The lock only guards the
+    in-memory state; the sms_log lookup runs outside it so a slow Mongo
+    doesn't stall other alert types. Returns a claim token to pass to
+    _finish_cooldown, or None if the send should be skipped.
+    """
+    now = time.monotonic()
+    if SMS_COOLDOWN_MINUTES.get(alert_type, 30) == 0:
+        return now
+    with _cooldown_lock:
+        claimed_at = _in_flight.get(alert_type)
+        if claimed_at is not None:
+            if now - claimed_at < SMS_IN_FLIGHT_MAX_AGE:
+                return None
+            print(f"[SMS] Stale '{alert_type}' send ({now - claimed_at:.0f}s) — taking over.")
+        _in_flight[alert_type] = now
+    try:
+        clear = not _is_on_cooldown(alert_type)
+    except Exception:
+        _finish_cooldown(alert_type, now, sent=False)
+        raise
+    if not clear:
+        _finish_cooldown(alert_type, now, sent=False)
+        return None
+    return now
+
+
+def _finish_cooldown(alert_type: str, token: float, sent: bool):
+    with _cooldown_lock:
+        # A stale send finishing late must not drop the claim that replaced it
+        if _in_flight.get(alert_type) == token:
+            del _in_flight[alert_type]
+        if sent:
+            _last_sent[alert_type] = time.monotonic()
 
 
 def _log_sms(alert_type: str, message: str, recipients: list, sid: str):
-    """Persist SMS send record for cooldown tracking and audit."""
+    """Persist SMS send record for the cross-worker cooldown check and audit."""
     sms_log_collection.insert_one({
         "alert_type": alert_type,
         "message":    message,
         "recipients": recipients,
         "twilio_sid": sid,
-        "sent_at":    datetime.utcnow().isoformat(),
+        "sent_at":    datetime.utcnow(),
     })
 
 
-def send_sms_alert(alert_type: str, message: str, recipients: list = None) -> dict:
+def send_sms_alert(alert_type: str, message: str | Callable[[], str],
+                   recipients: list = None) -> dict:
     """
     Send an SMS via Twilio to all recipients.
     Respects per-type cooldown window. Returns a result dict.
+    `message` may be a zero-arg callable; it is only built if the
+    cooldown lets the SMS through.
     """
     if recipients is None:
         recipients = ALERT_RECIPIENTS
 
-    if _is_on_cooldown(alert_type):
+    numbers = []
+    for number in recipients:
+        if not number or "XXXXXXXXXX" in number:
+            print(f"[SMS] Skipping placeholder number: {number}")
+            continue
+        numbers.append(number)
+
+    if not numbers:
+        return {"sent": False, "reason": "no valid recipients"}
+
+    token = _claim_cooldown(alert_type)
+    if token is None:
         print(f"[SMS] Cooldown active for '{alert_type}' — skipping.")
         return {"sent": False, "reason": "cooldown"}
 
-    results  = []
-    last_sid = None
+    def _send_one(number):
+        msg = twilio_client.messages.create(
+            body=message,
+            from_=TWILIO_FROM_NUMBER,
+            to=number
+        )
+        print(f"[SMS] ✅ Sent to {number} — SID: {msg.sid}")
+        return {"to": number, "sid": msg.sid, "status": msg.status}
 
     try:
-        for number in recipients:
-            if not number or "XXXXXXXXXX" in number:
-                print(f"[SMS] Skipping placeholder number: {number}")
-                continue
-            msg = twilio_client.messages.create(
-                body=message,
-                from_=TWILIO_FROM_NUMBER,
-                to=number
-            )
-            last_sid = msg.sid
-            results.append({"to": number, "sid": msg.sid, "status": msg.status})
-            print(f"[SMS] ✅ Sent to {number} — SID: {msg.sid}")
-
-        if last_sid:
-            _log_sms(alert_type, message, recipients, last_sid)
-            return {"sent": True, "count": len(results), "results": results}
-
-        return {"sent": False, "reason": "no valid recipients"}
-
+        if callable(message):
+            message = message()
+        # Twilio calls are network-bound; send to all recipients in parallel
+        with ThreadPoolExecutor(max_workers=min(SMS_MAX_WORKERS, len(numbers))) as ex:
+            results = list(ex.map(_send_one, numbers))
     except Exception as e:
+        _finish_cooldown(alert_type, token, sent=False)
         print(f"[SMS] ❌ Twilio error: {e}")
         return {"sent": False, "reason": str(e)}
+    _finish_cooldown(alert_type, token, sent=True)
+
+    try:
+        _log_sms(alert_type, message, recipients, results[-1]["sid"])
+    except Exception as e:
+        print(f"[SMS] Log write error: {e}")
+    return {"sent": True, "count": len(results), "results": results}
+
+
+_sms_dispatcher = ThreadPoolExecutor(
+    max_workers=SMS_DISPATCH_WORKERS, thread_name_prefix="sms-dispatch"
+)
+
+
+def dispatch_sms_alert(alert_type: str, message: str | Callable[[], str],
+                       recipients: list = None) -> Future:
+    """Run send_sms_alert on the background pool; the caller doesn't wait."""
+    future = _sms_dispatcher.submit(send_sms_alert, alert_type, message, recipients)
+    future.add_done_callback(partial(_log_dispatch_error, alert_type))
+    return future
+
+
+def _log_dispatch_error(alert_type: str, future: Future):
+    # Nobody waits on these futures, so anything send_sms_alert raised
+    # (e.g. the sms_log cooldown lookup failing) would otherwise vanish
+    error = future.exception()
+    if error is not None:
+        print(f"[SMS] ❌ '{alert_type}' dispatch failed: {error!r}")
 
 
 # ===============================
@@ -177,96 +674,55 @@ def send_sms_alert(alert_type: str, message: str, recipients: list = None) -> di
 def check_and_send_sensor_sms(sensor_data: dict, risk: str):
     """
     Evaluates every incoming sensor reading against thresholds.
-    Fires targeted SMS alerts for each hazard type independently.
+    Fires targeted SMS alerts for each hazard type independently; the
+    sends run concurrently on the dispatch pool so the request returns
+    without waiting on Twilio.
     """
     distance    = sensor_data.get("distance",      999)
     rain        = sensor_data.get("rain_level",    0)
     air         = sensor_data.get("air_quality",   0)
     temperature = sensor_data.get("temperature",   0)
-    ts          = sensor_data.get("timestamp", datetime.utcnow().isoformat())
-    ts_fmt      = ts[:19].replace("T", " ") + " UTC"
+
+    # Common case: nothing is past a warn level, so there is nothing to send
+    if (distance > _D_WARN and rain < _R_WARN and air < _A_WARN
+            and temperature < _T_WARN and risk != "HIGH"):
+        return
+
+    fields      = {
+        "distance": distance, "rain": rain, "air": air, "temperature": temperature,
+        "ts": sensor_data.get("timestamp") or datetime.utcnow(),
+    }
+
+    # Bodies are passed as thunks so they are only formatted once the
+    # cooldown check in send_sms_alert has let the message through.
 
     # ── Flood / Water Level ────────────────────────────────────────────────────
-    if distance <= THRESHOLDS["distance"]["critical"]:
-        send_sms_alert(
-            "FLOOD",
-            f"MHEWS CRITICAL FLOOD ALERT\n"
-            f"Water sensor: {distance}cm (DANGER LEVEL)\n"
-            f"Immediate evacuation may be required.\n"
-            f"Time: {ts_fmt}"
-        )
-    elif distance <= THRESHOLDS["distance"]["warn"]:
-        send_sms_alert(
-            "FLOOD",
-            f"MHEWS Flood Warning\n"
-            f"Water rising. Distance: {distance}cm.\n"
-            f"Monitor closely and prepare to evacuate.\n"
-            f"Time: {ts_fmt}"
-        )
+    if distance <= _D_CRIT:
+        dispatch_sms_alert("FLOOD", partial(SMS_FLOOD_CRITICAL.format_map, fields))
+    elif distance <= _D_WARN:
+        dispatch_sms_alert("FLOOD", partial(SMS_FLOOD_WARN.format_map, fields))
 
     # ── Heavy Rain ─────────────────────────────────────────────────────────────
-    if rain >= THRESHOLDS["rain_level"]["critical"]:
-        send_sms_alert(
-            "RAIN",
-            f"MHEWS Heavy Rain CRITICAL\n"
-            f"Rain sensor: {rain}/100\n"
-            f"Flash flood risk. Move to higher ground.\n"
-            f"Time: {ts_fmt}"
-        )
-    elif rain >= THRESHOLDS["rain_level"]["warn"]:
-        send_sms_alert(
-            "RAIN",
-            f"MHEWS Rain Advisory\n"
-            f"Rain intensity: {rain}/100 (HIGH)\n"
-            f"Avoid low-lying areas.\n"
-            f"Time: {ts_fmt}"
-        )
+    if rain >= _R_CRIT:
+        dispatch_sms_alert("RAIN", partial(SMS_RAIN_CRITICAL.format_map, fields))
+    elif rain >= _R_WARN:
+        dispatch_sms_alert("RAIN", partial(SMS_RAIN_WARN.format_map, fields))
 
     # ── Air Quality ────────────────────────────────────────────────────────────
-    if air >= THRESHOLDS["air_quality"]["critical"]:
-        send_sms_alert(
-            "AIR",
-            f"MHEWS Air Quality CRITICAL\n"
-            f"AQI: {air} PPM — Hazardous.\n"
-            f"Stay indoors. Wear masks immediately.\n"
-            f"Time: {ts_fmt}"
-        )
-    elif air >= THRESHOLDS["air_quality"]["warn"]:
-        send_sms_alert(
-            "AIR",
-            f"MHEWS Air Quality Warning\n"
-            f"AQI: {air} PPM — Unhealthy.\n"
-            f"Limit outdoor exposure.\n"
-            f"Time: {ts_fmt}"
-        )
+    if air >= _A_CRIT:
+        dispatch_sms_alert("AIR", partial(SMS_AIR_CRITICAL.format_map, fields))
+    elif air >= _A_WARN:
+        dispatch_sms_alert("AIR", partial(SMS_AIR_WARN.format_map, fields))
 
     # ── Temperature / Fire Risk ────────────────────────────────────────────────
-    if temperature >= THRESHOLDS["temperature"]["critical"]:
-        send_sms_alert(
-            "FIRE",
-            f"MHEWS Extreme Heat / Fire Risk\n"
-            f"Temperature: {temperature}C (CRITICAL)\n"
-            f"Extreme fire danger conditions.\n"
-            f"Time: {ts_fmt}"
-        )
-    elif temperature >= THRESHOLDS["temperature"]["warn"]:
-        send_sms_alert(
-            "FIRE",
-            f"MHEWS Heat Warning\n"
-            f"Temperature: {temperature}C (HIGH)\n"
-            f"High fire risk. Stay alert.\n"
-            f"Time: {ts_fmt}"
-        )
+    if temperature >= _T_CRIT:
+        dispatch_sms_alert("FIRE", partial(SMS_FIRE_CRITICAL.format_map, fields))
+    elif temperature >= _T_WARN:
+        dispatch_sms_alert("FIRE", partial(SMS_FIRE_WARN.format_map, fields))
 
     # ── ML Model HIGH Risk (catch-all) ─────────────────────────────────────────
     if risk == "HIGH":
-        send_sms_alert(
-            "RISK_HIGH",
-            f"MHEWS SYSTEM ALERT — HIGH RISK\n"
-            f"ML model predicts HIGH hazard risk.\n"
-            f"Temp:{temperature}C Rain:{rain} Water:{distance}cm AQI:{air}\n"
-            f"Time: {ts_fmt}"
-        )
+        dispatch_sms_alert("RISK_HIGH", partial(SMS_RISK_HIGH.format_map, fields))
 
 
 # ===============================
@@ -281,15 +737,17 @@ def home():
 @app.route("/sensor-data", methods=["POST"])
 def receive_sensor_data():
     try:
-        data = request.json
+        body = request.get_data()
+        data = orjson.loads(body) if body else None
         if not data:
             return {"error": "No JSON received"}, 400
 
-        data["timestamp"] = datetime.utcnow().isoformat()
-        risk              = evaluate_risk(data)
-        data["risk"]      = risk
+        data["timestamp"]  = datetime.utcnow()
+        risk               = evaluate_risk(data)
+        data["risk"]       = risk
+        data["risk_score"] = RISK_SCORE_MAP[risk]   # stored so /weekly-risk sums ints
 
-        collection.insert_one(data)
+        sensor_writer.append(data)   # persisted asynchronously, see _WriteBehindBuffer
 
         # Trigger SMS checks on every reading
         check_and_send_sensor_sms(data, risk)
@@ -343,7 +801,7 @@ def get_sms_log():
         logs = list(sms_log_collection.find().sort("_id", -1).limit(50))
         for l in logs:
             l["_id"] = str(l["_id"])
-        return jsonify(logs)
+        return orjson_response(logs)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -351,45 +809,80 @@ def get_sms_log():
 # ===============================
 # Weekly Risk Route
 # ===============================
-RISK_SCORE_MAP = {"LOW": 1, "MEDIUM": 2, "HIGH": 3, "UNKNOWN": 0}
-RISK_LABEL_MAP = {1: "LOW", 2: "MEDIUM", 3: "HIGH", 0: "UNKNOWN"}
+# Server-side RISK_SCORE_MAP lookup for readings stored before risk_score
+_RISK_SCORE_EXPR = {"$switch": {
+    "branches": [
+        {"case": {"$eq": ["$risk", label]}, "then": score}
+        for label, score in RISK_SCORE_MAP.items() if score
+    ],
+    "default": 0,
+}}
+
+# "YYYY-MM-DD" for both BSON-date and legacy ISO-string timestamps
+_DAY_KEY_EXPR = {"$cond": [
+    {"$eq": [{"$type": "$timestamp"}, "string"]},
+    {"$substrBytes": ["$timestamp", 0, 10]},
+    {"$dateToString": {"format": "%Y-%m-%d", "date": "$timestamp"}},
+]}
+
+# The dashboard polls this endpoint; readings arrive continuously, so the
+# summary is simply allowed to be up to WEEKLY_RISK_TTL seconds stale
+# rather than invalidated on every insert.
+WEEKLY_RISK_TTL = 30
+
+
+@cachetools.func.ttl_cache(maxsize=1, ttl=WEEKLY_RISK_TTL)
+def _weekly_risk_summary() -> list:
+    """Average risk per day for the last 7 days (oldest first)."""
+    today      = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    week_start = today - timedelta(days=6)
+
+    day_buckets = {}
+    for i in range(7):
+        day = week_start + timedelta(days=i)
+        day_buckets[day.strftime("%Y-%m-%d")] = {
+            "name": day.strftime("%a"), "total_score": 0, "count": 0
+        }
+
+    # Bucket per day in Mongo; at most 7 rows come back. Readings stored
+    # before timestamps became BSON dates hold ISO strings, whose day key
+    # is just the "YYYY-MM-DD" prefix.
+    pipeline = [
+        {"$match": {"$or": [
+            {"timestamp": {"$gte": week_start}},
+            {"timestamp": {"$gte": week_start.isoformat()}},
+        ]}},
+        {"$group": {
+            "_id":         _DAY_KEY_EXPR,
+            "total_score": {"$sum": {"$ifNull": ["$risk_score", _RISK_SCORE_EXPR]}},
+            "count":       {"$sum": 1},
+        }},
+    ]
+    for row in collection.aggregate(pipeline):
+        bucket = day_buckets.get(row["_id"])
+        if bucket is not None:
+            bucket["total_score"] = row["total_score"]
+            bucket["count"]       = row["count"]
+
+    result = []
+    for i in range(7):
+        day_key = (week_start + timedelta(days=i)).strftime("%Y-%m-%d")
+        bucket  = day_buckets[day_key]
+        count   = bucket["count"]
+        avg     = (bucket["total_score"] / count) if count > 0 else 0
+        result.append({
+            "name":       bucket["name"],
+            "risk":       round(avg, 2),
+            "risk_label": RISK_LABEL_MAP.get(round(avg), "NONE") if count > 0 else "NONE",
+            "count":      count
+        })
+    return result
+
 
 @app.route("/weekly-risk", methods=["GET"])
 def weekly_risk():
     try:
-        today      = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
-        week_start = today - timedelta(days=6)
-
-        day_buckets = {}
-        for i in range(7):
-            day = week_start + timedelta(days=i)
-            day_buckets[day.strftime("%Y-%m-%d")] = {
-                "name": day.strftime("%a"), "total_score": 0, "count": 0
-            }
-
-        for doc in collection.find({"timestamp": {"$gte": week_start.isoformat()}}):
-            try:
-                day_key = datetime.fromisoformat(doc["timestamp"]).strftime("%Y-%m-%d")
-                score   = RISK_SCORE_MAP.get(doc.get("risk", "UNKNOWN"), 0)
-                if day_key in day_buckets:
-                    day_buckets[day_key]["total_score"] += score
-                    day_buckets[day_key]["count"]       += 1
-            except Exception:
-                continue
-
-        result = []
-        for i in range(7):
-            day_key = (week_start + timedelta(days=i)).strftime("%Y-%m-%d")
-            bucket  = day_buckets[day_key]
-            count   = bucket["count"]
-            avg     = (bucket["total_score"] / count) if count > 0 else 0
-            result.append({
-                "name":       bucket["name"],
-                "risk":       round(avg, 2),
-                "risk_label": RISK_LABEL_MAP.get(round(avg), "NONE") if count > 0 else "NONE",
-                "count":      count
-            })
-        return jsonify(result)
+        return jsonify(_weekly_risk_summary())
 
     except Exception as e:
         print("Weekly Risk Error:", e)
@@ -400,21 +893,81 @@ def weekly_risk():
 # Alerts Routes
 # ===============================
 
-def severity_order(s):
-    return {"Critical": 0, "High": 1, "Moderate": 2, "Low": 3}.get(s, 4)
+ALERT_ID_MAX_ATTEMPTS = 5
+
+_seeded_alert_years = set()
+
+
+def _seed_alert_counter(year: int):
+    """
+    Raise the year's counter to the highest AL-YEAR-NNN suffix already in
+    alerts, so ids issued before the counter existed are never reused.
+    $max never lowers the counter, so concurrent workers can all seed.
+    """
+    rows = list(alerts_collection.aggregate([
+        {"$match": {"id": {"$regex": f"^AL-{year}-[0-9]+$"}}},
+        {"$group": {
+            "_id": None,
+            "n":   {"$max": {"$toInt": {"$arrayElemAt": [{"$split": ["$id", "-"]}, 2]}}},
+        }},
+    ]))
+    highest = (rows[0]["n"] if rows else None) or 0
+    counters_collection.update_one(
+        {"_id": f"alert-{year}"}, {"$max": {"n": highest}}, upsert=True
+    )
+    _seeded_alert_years.add(year)
+
+
+def _next_alert_id(year: int) -> str:
+    """Reserve the next AL-YEAR-NNN id with a single atomic $inc."""
+    if year not in _seeded_alert_years:
+        _seed_alert_counter(year)
+    counter = counters_collection.find_one_and_update(
+        {"_id": f"alert-{year}"},
+        {"$inc": {"n": 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return f"AL-{year}-{counter['n']:03d}"
+
+
+SEVERITY_RANK = {"Critical": 0, "High": 1, "Moderate": 2, "Low": 3}
+
+
+# Sort keys stored on each alert so /alerts can sort in Mongo via the index:
+#   active_rank   0 = Active, 1 = anything else (Resolved)
+#   severity_rank SEVERITY_RANK value, 4 = unknown
+ALERT_SORT   = [("active_rank", 1), ("severity_rank", 1), ("_id", -1)]
+ALERT_HIDDEN = {"active_rank": 0, "severity_rank": 0}
+
+
+def _backfill_alert_ranks():
+    """One-off: add the sort keys to alerts created before they existed."""
+    try:
+        alerts_collection.update_many(
+            {"active_rank": {"$exists": False}},
+            [{"$set": {
+                "active_rank":   {"$cond": [{"$eq": ["$status", "Active"]}, 0, 1]},
+                "severity_rank": {"$switch": {
+                    "branches": [
+                        {"case": {"$eq": ["$severity", name]}, "then": rank}
+                        for name, rank in SEVERITY_RANK.items()
+                    ],
+                    "default": 4,
+                }},
+            }}]
+        )
+    except Exception as e:
+        print("Alert Rank Backfill Error:", e)
 
 
 @app.route("/alerts", methods=["GET"])
 def get_alerts():
     try:
-        docs = list(alerts_collection.find().sort("_id", -1).limit(100))
+        docs = list(alerts_collection.find({}, ALERT_HIDDEN).sort(ALERT_SORT).limit(100))
         for doc in docs:
             doc["_id"] = str(doc["_id"])
-        docs.sort(key=lambda d: (
-            0 if d.get("status") == "Active" else 1,
-            severity_order(d.get("severity", ""))
-        ))
-        return jsonify(docs)
+        return orjson_response(docs)
     except Exception as e:
         print("Alerts GET Error:", e)
         return jsonify({"error": "Could not fetch alerts"}), 500
@@ -431,12 +984,8 @@ def create_alert():
             if not data.get(field):
                 return jsonify({"error": f"Missing field: {field}"}), 400
 
-        count    = alerts_collection.count_documents({})
-        year     = datetime.utcnow().year
-        alert_id = f"AL-{year}-{str(count + 1).zfill(3)}"
-
         alert = {
-            "id":        alert_id,
+            "id":        None,   # assigned below
             "type":      data["type"],
             "severity":  data["severity"],
             "location":  data["location"],
@@ -444,9 +993,30 @@ def create_alert():
             "channels":  data.get("channels", []),
             "status":    "Active",
             "timestamp": datetime.utcnow().isoformat(),
+            "active_rank":   0,
+            "severity_rank": SEVERITY_RANK.get(data["severity"], 4),
         }
-        alerts_collection.insert_one(alert)
+
+        # The seeded counter should never collide. The lookup guards DBs
+        # where legacy duplicates kept the unique alerts.id index from
+        # building; the index catches races with writers outside this app.
+        year = datetime.utcnow().year
+        for _ in range(ALERT_ID_MAX_ATTEMPTS):
+            alert_id    = _next_alert_id(year)
+            alert["id"] = alert_id
+            if alerts_collection.find_one({"id": alert_id}, {"_id": 1}) is not None:
+                print(f"Alert id {alert_id} already taken — skipping.")
+                continue
+            try:
+                alerts_collection.insert_one(alert)
+                break
+            except DuplicateKeyError:
+                print(f"Alert id {alert_id} already taken — skipping.")
+        else:
+            return jsonify({"error": "Could not allocate alert id"}), 500
         alert["_id"] = str(alert["_id"])
+        for field in ALERT_HIDDEN:
+            alert.pop(field)
 
         # Auto-send SMS if operator selected SMS channel in the dashboard
         if "SMS" in alert.get("channels", []):
@@ -471,7 +1041,11 @@ def resolve_alert(alert_id):
     try:
         result = alerts_collection.update_one(
             {"id": alert_id},
-            {"$set": {"status": "Resolved", "resolved_at": datetime.utcnow().isoformat()}}
+            {"$set": {
+                "status":      "Resolved",
+                "resolved_at": datetime.utcnow().isoformat(),
+                "active_rank": 1,
+            }}
         )
         if result.matched_count == 0:
             return jsonify({"error": "Alert not found"}), 404
@@ -491,8 +1065,44 @@ def delete_alert(alert_id):
         return jsonify({"error": "Could not delete alert"}), 500
 
 
+# ===============================
+# Startup DB Tasks
+# ===============================
+STARTUP_MONGO_TIMEOUT_MS = 5000   # server-selection timeout for the reachability probe
+STARTUP_RETRY_INTERVAL   = 30     # seconds between probes while Mongo is down
+
+
+def _run_startup_tasks():
+    """
+    One-off DB setup: indexes, the alert rank backfill and the alert id
+    counter seed. Runs on a background thread so an unreachable Mongo
+    doesn't stall import (each op could otherwise wait 30 s for server
+    selection); it waits for a short-timeout ping to succeed first.
+    """
+    while True:
+        try:
+            with MongoClient(MONGO_URI, serverSelectionTimeoutMS=STARTUP_MONGO_TIMEOUT_MS) as probe:
+                probe.admin.command("ping")
+            break
+        except Exception as e:
+            print(f"Startup DB tasks waiting, MongoDB unreachable: {e!r}")
+            time.sleep(STARTUP_RETRY_INTERVAL)
+
+    _ensure_indexes()
+    _backfill_alert_ranks()
+    try:
+        _seed_alert_counter(datetime.utcnow().year)
+    except Exception as e:
+        # Retried on the first create_alert; alerts aren't issued unseeded
+        print("Alert Counter Seed Error:", e)
+
+
+threading.Thread(target=_run_startup_tasks, name="db-startup", daemon=True).start()
+
+
 # ===============================
 # Run Server
 # ===============================
+# Development only; in production run under gunicorn (see gunicorn.conf.py)
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000)
\ No newline at end of file
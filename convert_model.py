@@ -0,0 +1,33 @@
+"""
+Offline export of the scikit-learn hazard model to ONNX.
+
+    python convert_model.py
+
+Writes rf_multi_hazard_model.onnx next to the pickle; app.py serves
+predictions from it through ONNX Runtime when the file exists. Needs
+skl2onnx, which is only required for this export step, not at runtime.
+"""
+import joblib
+from skl2onnx import convert_sklearn
+from skl2onnx.common.data_types import FloatTensorType
+
+MODEL_PATH      = "rf_multi_hazard_model.pkl"
+ONNX_MODEL_PATH = "rf_multi_hazard_model.onnx"
+
+
+def main():
+    model      = joblib.load(MODEL_PATH)
+    n_features = model.n_features_in_
+
+    onx = convert_sklearn(
+        model,
+        initial_types=[("X", FloatTensorType([None, n_features]))],
+        options={id(model): {"zipmap": False}},   # plain label/probability tensors
+    )
+    with open(ONNX_MODEL_PATH, "wb") as f:
+        f.write(onx.SerializeToString())
+    print(f"Wrote {ONNX_MODEL_PATH} ({n_features} features)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,15 @@
+# ===============================
+# Gunicorn Config
+# ===============================
+# Usage: gunicorn -c gunicorn.conf.py wsgi:app
+import os
+
+bind         = os.environ.get("MHEWS_BIND", "0.0.0.0:5000")
+worker_class = "gthread"          # threads overlap Mongo / Twilio I/O
+workers      = int(os.environ.get("MHEWS_WORKERS", 4))
+threads      = int(os.environ.get("MHEWS_THREADS", 16))
+keepalive    = 5                  # seconds; sensors POST repeatedly
+
+# Keep False: app.py opens the MongoClient and Twilio session at import,
+# and each worker must build its own pools after the fork.
+preload_app  = False